@@ -5,13 +5,22 @@
 # ########################################################################### #
 
 from __future__ import division
+import concurrent.futures
+import functools
+import mmap
 import subprocess
 import zlib
 import os.path
 import os
 import re
 import sys
-import fnmatch
+import threading
+import glob
+
+try:
+    import xxhash #optional, much faster dedup fingerprints than crc32
+except ImportError:
+    xxhash = None
 
 def print_usage(appname):
     print("Usage: {} (filename) [options]".format(appname)+"\n"
@@ -67,22 +76,83 @@ def print_help(appname):
 # ########################################################################### #
 
 def find_files(dir, pattern, recursive):
+    if os.path.isfile(pattern): #literal filename, no need to scan dirs
+        return [pattern]
+
+    if recursive:
+        search = os.path.join(dir, '**', pattern)
+    else:
+        search = os.path.join(dir, pattern)
+
     files = []
-    for root, dirnames, filenames in os.walk(dir):
-        for filename in fnmatch.filter(filenames, pattern):
-            files.append(os.path.join(root, filename))
+    for file in glob.glob(search, recursive=recursive):
+        if os.path.isfile(file):
+            files.append(file)
 
-        if not recursive:
-            break
-            
     return files
 
-def make_cmd(cfg, fname_in, fname_out, target_subsong):
-    if (cfg.test_dupes):
-        cmd = "{} -s {} -i -o \"{}\" \"{}\"".format(cfg.cli, target_subsong, fname_out, fname_in)
+def detect_batch_mode(cfg):
+    #probed once per run, the result travels to workers on cfg
+    try:
+        output_b = subprocess.check_output([cfg.cli, '--help'], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        output_b = e.output
+    except OSError:
+        return False
+    return output_b != None and b'--batch' in output_b
+
+def make_info_cmd(cfg, fname_in, target_subsong):
+    return [cfg.cli, "-s", str(target_subsong), "-m", "-i", fname_in]
+
+def make_decode_cmd(cfg, fname_in, fname_out, target_subsong):
+    return [cfg.cli, "-s", str(target_subsong), "-i", "-o", fname_out, fname_in]
+
+def probe_subsong(cli, cfg, log, writer, fname_in, fname_in_base, target_subsong):
+    #temp name is per-subsong so parallel probes don't clobber each other
+    fname_out = ".temp.{}.{}.wav".format(fname_in_base, target_subsong)
+
+    try:
+        #metadata-only probe first: filtered subsongs never pay for a decode
+        cmd = make_info_cmd(cfg, fname_in, target_subsong)
+        log.trace("calling: " + subprocess.list2cmdline(cmd))
+        fields = cli.call_fields(cmd)
+
+        maker = TxtpMaker(cfg, fields, log, writer)
+
+        if cfg.test_dupes and not maker.is_ignorable():
+            cmd = make_decode_cmd(cfg, fname_in, fname_out, target_subsong)
+            log.trace("calling: " + subprocess.list2cmdline(cmd))
+            cli.call(cmd)
+        else:
+            fname_out = None #nothing decoded, nothing to hash
+
+        return (target_subsong, fname_out, maker, None)
+    except subprocess.CalledProcessError as e:
+        return (target_subsong, fname_out, None, e)
+
+def process_subsong(cfg, log, crc32, result, fname_in, fname_in_base, fname_in_clean, fname_in_noext):
+    (target_subsong, fname_out, maker, error) = result
+
+    if error is not None:
+        log.debug("ignoring CLI error in " + fname_in + "#" + str(target_subsong) + ": " + str(error.output))
+        if fname_out is not None and os.path.exists(fname_out):
+            os.remove(fname_out)
+        return (0, 0, 1, None)
+
+    created = 0
+    dupes = 0
+    if fname_out is not None:
+        crc32.update(fname_out)
+        if os.path.exists(fname_out):
+            os.remove(fname_out)
+
+    if not crc32.is_dupe():
+        created = maker.make(fname_in_base, fname_in_clean, fname_in_noext)
     else:
-        cmd = "{} -s {} -m -i -o \"{}\" \"{}\"".format(cfg.cli, target_subsong, fname_out, fname_in)
-    return cmd
+        dupes = 1
+        log.debug("Dupe subsong {}".format(target_subsong))
+
+    return (created, dupes, 0, maker)
 
 class LogHelper(object):
 
@@ -104,6 +174,9 @@ class LogHelper(object):
         if v == "trace" or v == "debug" or v == "info":
             print(msg)
 
+#tags accepted in -n base names, see print_help
+_BASE_NAME_RE = re.compile(r'({filename}|{subsong}|{internal-name})')
+
 class ConfigHelper(object):
     show_help = False
     cli = "test.exe"
@@ -123,6 +196,7 @@ class ConfigHelper(object):
     use_internal_index = False
 
     test_dupes = False
+    batch_mode = False
     min_channels = 0
     max_channels = 0
     min_sample_rate = 0
@@ -213,27 +287,154 @@ class ConfigHelper(object):
         if (self.subdir != '') and not (self.subdir.endswith('/') or self.subdir.endswith('\\')):
             self.subdir += '/'
 
+        #compiled once here rather than once per subsong
+        self.exclude_re = None
+        if self.exclude_regex != "":
+            self.exclude_re = re.compile(self.exclude_regex)
+        self.include_re = None
+        if self.include_regex != "":
+            self.include_re = re.compile(self.include_regex)
+
+        #split the -n template into literal/tag parts once, make() only joins
+        self.base_name_parts = None
+        if self.base_name != '':
+            self.base_name_parts = _BASE_NAME_RE.split(self.base_name)
+
     def __str__(self):
         return str(self.__dict__)
 
 
+class CliHelper(object):
+    # runs the CLI one subprocess per command, or, when the CLI advertises
+    # batch mode, through a single persistent process to avoid paying
+    # process-startup cost per subsong.
+    #
+    # batch contract: one command line in (newline-ended), one block out,
+    # prefixed by an ascii "(length)\n" header; negative length means the
+    # command failed.
+
+    proc = None
+
+    def __init__(self, cfg, log):
+        self.cfg = cfg
+        self.log = log
+        self.lock = threading.Lock()
+
+        if cfg.batch_mode:
+            log.debug("using CLI batch mode")
+            self.proc = subprocess.Popen([cfg.cli, '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def read_block(self):
+        header = self.proc.stdout.readline()
+        try:
+            length = int(header)
+        except ValueError: #empty/garbled header, the batch process died
+            return None
+        if length < 0:
+            return None
+
+        block = b''
+        while len(block) < length:
+            chunk = self.proc.stdout.read(length - len(block))
+            if not chunk:
+                break
+            block += chunk
+        return block
+
+    def call(self, cmd):
+        if self.proc is None:
+            return subprocess.check_output(cmd, shell=False) #stderr=subprocess.STDOUT
+
+        with self.lock: #single pipe, batch calls are serialized
+            self.proc.stdin.write(subprocess.list2cmdline(cmd).encode('utf-8') + b'\n')
+            self.proc.stdin.flush()
+            block = self.read_block()
+
+        if block is None:
+            raise subprocess.CalledProcessError(1, cmd, output=b'')
+        return block
+
+    def parse_fields(self, output_b):
+        fields = {}
+        for line in output_b.decode('utf-8', 'replace').splitlines():
+            (key, sep, val) = line.partition(': ')
+            if sep and key in _FIELD_NAMES:
+                fields[key] = val
+        return fields
+
+    def call_fields(self, cmd):
+        if self.proc is not None:
+            return self.parse_fields(self.call(cmd))
+
+        #stream stdout rather than buffering it whole, and stop reading
+        #once every field of interest has shown up
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        fields = {}
+        done = False
+        with proc.stdout:
+            for line in proc.stdout:
+                (key, sep, val) = line.decode('utf-8', 'replace').partition(': ')
+                if not sep or key not in _FIELD_NAMES:
+                    continue
+                fields[key] = val.rstrip('\r\n')
+                if len(fields) >= len(_FIELD_NAMES):
+                    done = True
+                    break
+        proc.wait()
+
+        #not all fields are printed for every format, so a clean exit with
+        #a partial dict is fine; an early break may kill the CLI via EPIPE,
+        #so its exit code only counts when the output was read to the end
+        if proc.returncode != 0 and not done:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output=b'')
+        return fields
+
+    def close(self):
+        if self.proc is None:
+            return
+        self.proc.stdin.close()
+        self.proc.wait()
+        self.proc = None
+
+
+#one CliHelper per process: in batch mode that's one persistent CLI per
+#pool worker instead of one per input file (workers leaving the pool close
+#their CLI's stdin on exit, which is its signal to quit)
+_process_cli = None
+
+def get_cli(cfg, log):
+    global _process_cli
+    if _process_cli is None:
+        _process_cli = CliHelper(cfg, log)
+    return _process_cli
+
+
 class Cr32Helper(object):
-    crc32_map = {}
+    #dupes are fingerprinted from the first 256KB of decoded audio, enough
+    #to tell streams apart without reading multi-MB wavs back in full
+    buf_limit = 0x40000
+
+    digest_map = set()
     dupe = False
     cfg = None
-    
+
     def __init__(self, cfg):
         self.cfg = cfg
 
-    def get_crc32(self, fname):
-        buf_size = 0x8000
+    def hash_buf(self, buf):
+        if xxhash is not None:
+            return xxhash.xxh3_64_intdigest(buf)
+        return zlib.crc32(buf) & 0xFFFFFFFF
+
+    def get_digest(self, fname):
         with open(fname, 'rb') as file:
-            buf = file.read(buf_size)
-            crc32 = 0
-            while len(buf) > 0:
-                crc32 = zlib.crc32(buf, crc32)
-                buf = file.read(buf_size)
-        return crc32 & 0xFFFFFFFF 
+            try:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as mv:
+                        digest = self.hash_buf(mv[0:self.buf_limit])
+                    return digest
+            except ValueError: #empty files can't be mapped
+                return self.hash_buf(file.read(self.buf_limit))
 
     def update(self, fname):
         cfg = self.cfg
@@ -244,11 +445,11 @@ class Cr32Helper(object):
         if not os.path.exists(fname):
             return
 
-        crc32_str = format(self.get_crc32(fname),'08x')
-        if (crc32_str in self.crc32_map):
+        digest = self.get_digest(fname)
+        if (digest in self.digest_map):
             self.dupe = True
             return
-        self.crc32_map[crc32_str] = True
+        self.digest_map.add(digest)
 
         return
 
@@ -256,6 +457,77 @@ class Cr32Helper(object):
         return self.dupe
 
 
+class WriterHelper(object):
+    #txtp contents are tiny, so open/write/close per file dominates on
+    #many-subsong banks; writes are queued and flushed in one pass per
+    #input file instead
+
+    def __init__(self, cfg, log):
+        self.cfg = cfg
+        self.log = log
+        self.pending = []
+        self.pending_names = set()
+        self.existing_map = {} #dir > set of names, avoids a stat per txtp
+
+    def exists(self, outname):
+        if outname in self.pending_names:
+            return True
+
+        dir = os.path.dirname(outname)
+        existing = self.existing_map.get(dir)
+        if existing is None:
+            try:
+                existing = set(os.listdir(dir if dir != '' else '.'))
+            except OSError:
+                existing = set()
+            self.existing_map[dir] = existing
+
+        return os.path.basename(outname) in existing
+
+    def add(self, outname, line):
+        self.pending.append((outname, line))
+        self.pending_names.add(outname)
+
+    def flush(self):
+        cfg = self.cfg
+
+        for (outname, line) in self.pending:
+            if cfg.overwrite:
+                ftxtp = open(outname, "w")
+            else:
+                retry = 0
+                while True:
+                    try:
+                        ftxtp = open(outname, "x") #atomic create, replaces exists+open
+                        break
+                    except FileExistsError:
+                        if not cfg.overwrite_rename:
+                            raise ValueError('TXTP exists in path: ' + outname)
+                        #another worker process created it behind the listing
+                        #cache; keep renaming like write() until a name is free
+                        outname = outname.replace(".txtp", "_{}.txtp".format(retry))
+                        retry += 1
+            with ftxtp:
+                if line != '':
+                    ftxtp.write(line)
+
+            self.log.debug("created: " + outname)
+
+            existing = self.existing_map.get(os.path.dirname(outname))
+            if existing is not None:
+                existing.add(os.path.basename(outname))
+
+        self.pending = []
+        self.pending_names.clear()
+
+
+#all CLI fields of interest, picked up in a single pass over the output
+_FIELD_NAMES = frozenset(('channels', 'sample rate', 'stream total samples', 'stream count', 'stream index', 'stream name'))
+
+#chars not allowed in filenames, replaced in one translate pass
+_BADCHARS_TABLE = str.maketrans('%*?:"|<>', '________')
+_PATHSEPS_RE = re.compile(r'[\\/]')
+
 class TxtpMaker(object):
     channels = 0
     sample_rate = 0
@@ -265,17 +537,17 @@ class TxtpMaker(object):
     stream_name = ''
     stream_seconds = 0
 
-    def __init__(self, cfg, output_b, log):
+    def __init__(self, cfg, fields, log, writer):
         self.cfg = cfg
         self.log = log
+        self.writer = writer
 
-        self.output = str(output_b).replace("\\r","").replace("\\n","\n")
-        self.channels = self.get_value("channels: ")
-        self.sample_rate = self.get_value("sample rate: ")
-        self.num_samples = self.get_value("stream total samples: ")
-        self.stream_count = self.get_value("stream count: ")
-        self.stream_index = self.get_value("stream index: ")
-        self.stream_name = self.get_string("stream name: ")
+        self.channels = self.get_field_value(fields, "channels")
+        self.sample_rate = self.get_field_value(fields, "sample rate")
+        self.num_samples = self.get_field_value(fields, "stream total samples")
+        self.stream_count = self.get_field_value(fields, "stream count")
+        self.stream_index = self.get_field_value(fields, "stream index")
+        self.stream_name = self.get_field_string(fields, "stream name")
 
         if self.channels == 0:
             raise ValueError('Incorrect command result')
@@ -285,16 +557,15 @@ class TxtpMaker(object):
     def __str__(self):
         return str(self.__dict__)
 
-    def get_string(self, str):
-        find_pos = self.output.find(str)
-        if (find_pos == -1):
+    def get_field_string(self, fields, key):
+        #keep first word only, values may carry units ("44100 Hz")
+        parts = fields.get(key, '').split()
+        if not parts:
             return ''
-        cut_pos = find_pos + len(str)
-        str_cut = self.output[cut_pos:]
-        return str_cut.split()[0]
+        return parts[0]
 
-    def get_value(self, str):
-        res = self.get_string(str)
+    def get_field_value(self, fields, key):
+        res = self.get_field_string(fields, key)
         if (res == ''):
            return 0;
         return int(res)
@@ -316,13 +587,11 @@ class TxtpMaker(object):
             return True;
         if (self.stream_count < cfg.min_subsongs):
             return True;
-        if (cfg.exclude_regex != "" and self.stream_name != ""):
-            p = re.compile(cfg.exclude_regex)
-            if (p.match(self.stream_name) != None):
+        if (cfg.exclude_re != None and self.stream_name != ""):
+            if (cfg.exclude_re.match(self.stream_name) != None):
                 return True
-        if (cfg.include_regex != "" and self.stream_name != ""):
-            p = re.compile(cfg.include_regex)
-            if (p.match(self.stream_name) == None):
+        if (cfg.include_re != None and self.stream_name != ""):
+            if (cfg.include_re.match(self.stream_name) == None):
                 return True
 
         return False
@@ -330,16 +599,11 @@ class TxtpMaker(object):
     def get_stream_mask(self, layer):
         cfg = self.cfg
 
-        mask = '#C'
-
         loops = cfg.layers + 1
         if layer + cfg.layers > self.channels:
             loops = self.channels - cfg.layers
-        for ch in range(1,loops):
-            mask += str(layer+ch) + ','
 
-        mask = mask[:-1]
-        return mask
+        return '#C' + ','.join(str(layer+ch) for ch in range(1,loops))
 
     def get_stream_name(self):
         cfg = self.cfg
@@ -349,22 +613,10 @@ class TxtpMaker(object):
         txt = self.stream_name
 
         # remove paths #todo maybe config/replace?
-        pos = txt.rfind("\\")
-        if (pos != -1):
-            txt = txt[pos+1:]
-        pos = txt.rfind("/")
-        if (pos != -1):
-            txt = txt[pos+1:]
+        txt = _PATHSEPS_RE.split(txt)[-1]
         # remove bad chars
-        txt = txt.replace("%", "_")
-        txt = txt.replace("*", "_")
-        txt = txt.replace("?", "_")
-        txt = txt.replace(":", "_")
-        txt = txt.replace("\"", "_")
-        txt = txt.replace("|", "_")
-        txt = txt.replace("<", "_")
-        txt = txt.replace(">", "_")
-    
+        txt = txt.translate(_BADCHARS_TABLE)
+
         if not cfg.use_internal_ext:
             pos = txt.rfind(".")
             if (pos != -1):
@@ -376,7 +628,7 @@ class TxtpMaker(object):
 
         outname += '.txtp'
 
-        if cfg.overwrite_rename and os.path.exists(outname):
+        if cfg.overwrite_rename and self.writer.exists(outname):
             if outname in cfg.rename_map:
                 rename_count = cfg.rename_map[outname]
             else:
@@ -384,17 +636,13 @@ class TxtpMaker(object):
             cfg.rename_map[outname] = rename_count + 1
             outname = outname.replace(".txtp", "_{}.txtp".format(rename_count))
 
-        if not cfg.overwrite and os.path.exists(outname):
+        if not cfg.overwrite and self.writer.exists(outname):
             raise ValueError('TXTP exists in path: ' + outname)
-        ftxtp = open(outname,"w+")
-        if line != '':
-            ftxtp.write(line)
-        ftxtp.close()
 
-        self.log.debug("created: " + outname)
+        self.writer.add(outname, line)
         return
 
-    def make(self, fname_path, fname_clean):
+    def make(self, fname_path, fname_clean, fname_noext):
         cfg = self.cfg
         total_done = 0
 
@@ -433,27 +681,16 @@ class TxtpMaker(object):
                     outname += "_{}".format(index)
             else:
                 if cfg.base_name != '':
-                    fname_base = os.path.basename(fname_path)
-                    pos = fname_base.rfind(".") #remove ext
-                    if (pos != -1 and pos > 1):
-                        fname_base = fname_base[:pos]
-                        
-                    internal_name = self.stream_name
-                
-                    txt = cfg.base_name
-                    txt = txt.replace("{filename}",fname_base)
-                    txt = txt.replace("{subsong}",index)
-                    txt = txt.replace("{internal-name}",internal_name)
-
-                    outname = "{}".format(txt)
+                    replaces = {
+                        "{filename}": fname_noext,
+                        "{subsong}": index,
+                        "{internal-name}": self.stream_name,
+                    }
 
-                else:
-                    txt = fname_path
-                    pos = txt.rfind(".") #remove ext
-                    if (pos != -1 and pos > 1):
-                        txt = txt[:pos]
+                    outname = ''.join(replaces.get(part, part) for part in cfg.base_name_parts)
 
-                    outname = "{}".format(txt)
+                else:
+                    outname = fname_noext
                     if index != "":
                         outname += "_" + index
 
@@ -482,6 +719,68 @@ class TxtpMaker(object):
 
 # ########################################################################### #
 
+def process_file(cfg, fname_in):
+    log = LogHelper(cfg)
+    cli = get_cli(cfg, log)
+    writer = WriterHelper(cfg, log)
+    crc32 = Cr32Helper(cfg)
+
+    fname_in_clean = fname_in.replace("\\", "/")
+    if fname_in_clean.startswith("./"):
+        fname_in_clean = fname_in_clean[2:]
+
+    fname_in_base = os.path.basename(fname_in)
+
+    #constant per file, no point redoing it per subsong
+    fname_in_noext = fname_in_base
+    pos = fname_in_base.rfind(".") #remove ext
+    if (pos != -1 and pos > 1):
+        fname_in_noext = fname_in_base[:pos]
+
+    if fname_in.startswith(".\\"): #skip starting dot for extensionless files
+        fname_in = fname_in[2:]
+
+    # probe first subsong alone to learn the file's total subsong count
+    result = probe_subsong(cli, cfg, log, writer, fname_in, fname_in_base, 1)
+    if result[3] is None:
+        log.debug("processing {}...".format(fname_in_clean))
+
+    (created, dupes, errors, maker) = process_subsong(cfg, log, crc32, result, fname_in, fname_in_base, fname_in_clean, fname_in_noext)
+
+    # probes are subprocess/IO bound so remaining subsongs go to a thread pool,
+    # while results are consumed here (crc32/rename maps aren't thread-safe).
+    # subsongs are submitted in bounded batches: with -fd every finished probe
+    # parks a decoded temp wav until its result is consumed in order, so one
+    # slow subsong must not let the rest of the bank pile up on disk
+    if maker is not None and maker.has_more_subsongs(1):
+        stream_count = maker.stream_count
+        workers = os.cpu_count()
+        batch_size = workers * 4
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            target_subsong = 2
+            for batch_start in range(2, stream_count + 1, batch_size):
+                batch = range(batch_start, min(batch_start + batch_size, stream_count + 1))
+                results = executor.map(
+                        lambda subsong: probe_subsong(cli, cfg, log, writer, fname_in, fname_in_base, subsong),
+                        batch)
+
+                for result in results:
+                    (sub_created, sub_dupes, sub_errors, _) = process_subsong(cfg, log, crc32, result, fname_in, fname_in_base, fname_in_clean, fname_in_noext)
+                    created += sub_created
+                    dupes += sub_dupes
+                    errors += sub_errors
+
+                    target_subsong += 1
+                    if target_subsong % 200 == 0:
+                        log.info("{}/{} subsongs... ".format(target_subsong, stream_count) +
+                                  "({} dupes, {} errors)".format(dupes, errors)
+                                  )
+
+    writer.flush()
+
+    return (created, dupes, errors)
+
 def main():
     appname = os.path.basename(sys.argv[0])
     if (len(sys.argv) <= 1):
@@ -489,7 +788,6 @@ def main():
         return
 
     cfg = ConfigHelper(sys.argv)
-    crc32 = Cr32Helper(cfg)
     log = LogHelper(cfg)
 
     if cfg.show_help:
@@ -499,65 +797,28 @@ def main():
     fname = sys.argv[1]
     fnames_in = find_files('.', fname, cfg.recursive)
 
+    cfg.batch_mode = detect_batch_mode(cfg)
+
+    # files are only independent while dupe filtering is off, so the process
+    # pool is used for that case alone; with -fd files stay in this process,
+    # in order, sharing one dedup map like always (dupe filtering is global
+    # across files and must not depend on pool scheduling)
+    if len(fnames_in) > 1 and not cfg.test_dupes:
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            results = list(executor.map(functools.partial(process_file, cfg), fnames_in))
+    else:
+        results = [process_file(cfg, fname_in) for fname_in in fnames_in]
+
     total_created = 0
     total_dupes = 0
     total_errors = 0
-    for fname_in in fnames_in:
-        fname_in_clean = fname_in.replace("\\", "/")
-        if fname_in_clean.startswith("./"):
-            fname_in_clean = fname_in_clean[2:]
-           
-        fname_in_base = os.path.basename(fname_in)
-        
-        if fname_in.startswith(".\\"): #skip starting dot for extensionless files
-            fname_in = fname_in[2:]
-        
-        fname_out = ".temp." + fname_in_base + ".wav"
-        created = 0
-        dupes = 0
-        errors = 0
-        target_subsong = 1
-        while 1:
-
-            try:
-                cmd = make_cmd(cfg, fname_in, fname_out, target_subsong)
-                log.trace("calling: " + cmd)
-                output_b = subprocess.check_output(cmd, shell=False) #stderr=subprocess.STDOUT
-            except subprocess.CalledProcessError as e:
-                log.debug("ignoring CLI error in " + fname_in + "#"+str(target_subsong)+": " + e.output)
-                errors += 1
-                break
-
-            if target_subsong == 1:
-                log.debug("processing {}...".format(fname_in_clean))
-
-            maker = TxtpMaker(cfg, output_b, log)
-
-            if not maker.is_ignorable():
-                crc32.update(fname_out)
-
-            if not crc32.is_dupe():
-                created += maker.make(fname_in_base, fname_in_clean)
-            else:
-                dupes += 1
-                log.debug("Dupe subsong {}".format(target_subsong))
-
-            if not maker.has_more_subsongs(target_subsong):
-                break
-            target_subsong += 1
-
-            if target_subsong % 200 == 0:
-                log.info("{}/{} subsongs... ".format(target_subsong, maker.stream_count) + 
-                          "({} dupes, {} errors)".format(dupes, errors)
-                          )
-
-        if os.path.exists(fname_out):
-            os.remove(fname_out)
-
+    for (created, dupes, errors) in results:
         total_created += created
         total_dupes += dupes
         total_errors += errors
 
+    if _process_cli is not None: #only set when files ran in this process
+        _process_cli.close()
 
     log.info("done! ({} done, {} dupes, {} errors)".format(total_created, total_dupes, total_errors))
     